@@ -1,13 +1,29 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import csv
-import re
-from typing import List, Dict, Optional, Set
+import logging
+from typing import List, Dict, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 import argparse
+import hashlib
+import os
+import tempfile
+import time
 from pathlib import Path
+from urllib.parse import urlparse
 import sys
 from datetime import datetime
 
+try:
+    import orjson  # Optional: faster decoding of large API responses
+except ImportError:
+    orjson = None
+
+log = logging.getLogger('immich_bulk')
+
 class AlbumAPIProcessor:
     """Process albums through API with capabilities to list, add, update, and remove users."""
     
@@ -15,162 +31,278 @@ class AlbumAPIProcessor:
     COL_ALBUM_ID = 'AlbumId'
     COL_ROLE = 'Role'
 
-    def __init__(self, base_url: str, api_key: str):
+    USER_CACHE_DIR = Path.home() / '.cache' / 'immich-bulk-share'
+    USER_CACHE_TTL = 3600  # Seconds before the cached user list is refetched
+
+    def __init__(self, base_url: str, api_key: str, max_workers: int = 8,
+                 verify_reachability: bool = False):
         """Initialize the API processor with base URL and authentication."""
-        self.base_url = self._validate_and_adjust_url(base_url)
+        self.max_workers = max_workers
         self.api_key = api_key
-        self.headers = {
+        self.session = self._create_session()
+        self.base_url = self._validate_and_adjust_url(base_url)
+        if verify_reachability:
+            self._check_server_reachable()
+        self.user_email_to_id = {}  # Cache for email to ID mapping
+        self._request_executor = None  # Pool for per-user requests while sharing
+
+    def _create_session(self) -> requests.Session:
+        """Create a pooled HTTP session so connections are reused across API calls."""
+        session = requests.Session()
+        # Headers are set once on the session instead of being merged into every request
+        session.headers.update({
             'Accept': 'application/json',
             'x-api-key': self.api_key
-        }
-        self.user_email_to_id = {}  # Cache for email to ID mapping
+        })
+        # Retry transient failures with exponential backoff instead of failing the album
+        retry = Retry(
+            total=4,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset(['HEAD', 'GET', 'PUT', 'DELETE']),
+            raise_on_status=False  # Hand back the last response so status checks still apply
+        )
+        # Album workers and the per-user request pool can each have max_workers requests
+        # in flight; size the keep-alive pool so none of those connections are discarded
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2 * self.max_workers, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
 
     def _validate_and_adjust_url(self, url: str) -> str:
         """Validate URL and switch to HTTPS if HTTP is used."""
-        if not re.match(r'^https?://', url):
+        parsed_url = urlparse(url)
+        if parsed_url.scheme not in ('http', 'https'):
             raise ValueError("Invalid URL provided. Ensure it starts with http:// or https://.")
         
-        parsed_url = requests.utils.urlparse(url)
         if parsed_url.scheme == 'http':
-            print("Warning: Switching to HTTPS for security.")
+            log.warning("Warning: Switching to HTTPS for security.")
             url = parsed_url._replace(scheme='https').geturl()
         
-        # Check server reachability
+        return url.rstrip('/')
+
+    def _check_server_reachable(self):
+        """Probe the lightweight ping endpoint and exit if the server cannot be reached."""
+        url = f"{self.base_url}/api/server/ping"
         try:
-            response = requests.get(url, timeout=5)
+            response = self.session.head(url, timeout=3)
             if response.status_code != 200:
-                print(f"Warning: The server responded with status code {response.status_code}.")
+                log.warning("Warning: The server responded with status code %s.", response.status_code)
         except requests.ConnectionError:
             sys.exit("Error: Cannot reach the server. Check your network connection and URL.")
         except requests.Timeout:
             sys.exit("Error: The server took too long to respond.")
-        
-        return url.rstrip('/')
+        except requests.exceptions.RequestException as e:
+            sys.exit(f"Error: Server check failed: {e}")
+
+    @staticmethod
+    def _json(response: requests.Response):
+        """Decode a JSON response body, using orjson when it is installed."""
+        if orjson is not None:
+            return orjson.loads(response.content)
+        return response.json()
 
     def get_albums(self) -> List[Dict]:
         """Fetch all albums from the API."""
         url = f"{self.base_url}/api/albums"
         try:
-            response = requests.get(url, headers=self.headers, timeout=5)
+            response = self.session.get(url, timeout=5)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching albums: {e}")
+            return self._json(response)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log.error("Error fetching albums: %s", e)
             sys.exit(1)
 
     def get_album_details(self, album_id: str) -> Optional[Dict]:
         """Fetch detailed information about a specific album."""
         url = f"{self.base_url}/api/albums/{album_id}?withoutAssets=true"
         try:
-            response = requests.get(url, headers=self.headers, timeout=5)
+            response = self.session.get(url, timeout=5)
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching album details for {album_id}: {e}")
+            return self._json(response)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log.error("Error fetching album details for %s: %s", album_id, e)
             return None
 
     def get_users(self) -> Dict[str, str]:
         """Fetch all users and create email to ID mapping."""
         url = f"{self.base_url}/api/users"
         try:
-            response = requests.get(url, headers=self.headers, timeout=5)
+            response = self.session.get(url, timeout=5)
             response.raise_for_status()
-            users = response.json()
+            users = self._json(response)
             
-            # Create email to ID mapping
-            email_to_id = {}
-            for user in users:
-                email = user.get('email')
-                user_id = user.get('id')
-                if email and user_id:
-                    email_to_id[email.lower()] = user_id  # Store emails in lowercase
+            # Create email to ID mapping, storing emails in lowercase
+            email_to_id = {user['email'].lower(): user['id']
+                           for user in users if user.get('email') and user.get('id')}
             
-            print(f"Loaded {len(email_to_id)} user email-ID mappings")
+            log.info("Loaded %s user email-ID mappings", len(email_to_id))
             return email_to_id
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching users: {e}")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log.error("Error fetching users: %s", e)
             sys.exit(1)
 
+    def _user_cache_path(self) -> Path:
+        """Return the user cache file for this server."""
+        digest = hashlib.sha256(self.base_url.encode('utf-8')).hexdigest()[:16]
+        return self.USER_CACHE_DIR / f"users_{digest}.json"
+
+    def _load_user_cache(self) -> Optional[Dict[str, str]]:
+        """Return the cached email to ID mapping, or None if it is missing or stale."""
+        path = self._user_cache_path()
+        try:
+            if path.stat().st_mtime < time.time() - self.USER_CACHE_TTL:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_user_cache(self, email_to_id: Dict[str, str]):
+        """Atomically write the email to ID mapping to the user cache."""
+        path = self._user_cache_path()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(email_to_id, f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            log.warning("Warning: Could not write user cache %s: %s", path, e)
+
+    def _load_users(self, required_emails: Set[str], refresh: bool = False) -> Dict[str, str]:
+        """Get the email to ID mapping from cache, refetching if it is stale or incomplete."""
+        if not refresh:
+            cached = self._load_user_cache()
+            if cached is not None:
+                missing = required_emails - cached.keys()
+                if not missing:
+                    log.info("Loaded %s user email-ID mappings from cache", len(cached))
+                    return cached
+                log.info("%s users not found in cache, refreshing...", len(missing))
+
+        log.info("Fetching user email to ID mapping...")
+        email_to_id = self.get_users()
+        self._save_user_cache(email_to_id)
+        return email_to_id
+
     def share_album_with_user(self, album_id: str, user_id: str, role: str) -> bool:
         """Share an album with a user or update their role."""
+        return self.share_album_with_users(album_id, [(user_id, role)])
+
+    def share_album_with_users(self, album_id: str, user_role_pairs: List[Tuple[str, str]]) -> bool:
+        """Share an album with several users (or update their roles) in a single request."""
         url = f"{self.base_url}/api/albums/{album_id}/users"
-        
-        headers = {**self.headers, 'Content-Type': 'application/json'}
         payload = {
             "albumUsers": [
                 {
                     "role": role,
                     "userId": user_id
                 }
+                for user_id, role in user_role_pairs
             ]
         }
         
         try:
-            response = requests.put(url, headers=headers, data=json.dumps(payload), timeout=5)
+            response = self.session.put(url, json=payload, timeout=(3.05, 10))
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            user_ids = ', '.join(user_id for user_id, _ in user_role_pairs)
+            log.error("Error sharing album %s with users %s: %s", album_id, user_ids, e)
+            return False
+
+    def update_album_user_role(self, album_id: str, user_id: str, role: str) -> bool:
+        """Change the role of a user who is already a member of an album."""
+        url = f"{self.base_url}/api/albums/{album_id}/user/{user_id}"
+        payload = {"role": role}
+
+        try:
+            response = self.session.put(url, json=payload, timeout=(3.05, 10))
             response.raise_for_status()
             return True
         except requests.exceptions.RequestException as e:
-            print(f"Error sharing album {album_id} with user {user_id}: {e}")
+            log.error("Error updating role of user %s in album %s: %s", user_id, album_id, e)
             return False
 
     def remove_user_from_album(self, album_id: str, user_id: str) -> bool:
         """Remove a user from an album."""
         url = f"{self.base_url}/api/albums/{album_id}/user/{user_id}"
         try:
-            response = requests.delete(url, headers=self.headers, timeout=5)
+            response = self.session.delete(url, timeout=5)
             response.raise_for_status()
             return True
         except requests.exceptions.RequestException as e:
-            print(f"Error removing user {user_id} from album {album_id}: {e}")
+            log.error("Error removing user %s from album %s: %s", user_id, album_id, e)
             return False
 
-    def get_current_album_users(self, album_id: str) -> Dict[str, str]:
-        """Get current users and their roles for an album."""
-        album_details = self.get_album_details(album_id)
-        if not album_details:
-            return {}
-        
+    def _map_requests(self, func, *iterables):
+        """Run independent API calls on the request pool, or inline when none is active."""
+        if self._request_executor is None:
+            return map(func, *iterables)
+        return self._request_executor.map(func, *iterables)
+
+    def get_current_album_users(self, album_id: str, album_details: Optional[Dict] = None) -> Dict[str, str]:
+        """Get current users and their roles for an album, reusing already fetched details if given."""
+        if album_details is None:
+            album_details = self.get_album_details(album_id)
+        current_users, _ = self._parse_album_users(album_details)
+        return current_users
+
+    @staticmethod
+    def _parse_album_users(album_details: Optional[Dict]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Return email to role and email to user ID mappings for an album's members."""
         current_users = {}
-        for user_info in album_details.get('albumUsers', []):
-            email = user_info.get('user', {}).get('email', '').lower()
+        member_ids = {}
+        for user_info in (album_details or {}).get('albumUsers', []):
+            user = user_info.get('user', {})
+            email = user.get('email', '').lower()
             role = user_info.get('role', '')
             if email and role:
                 current_users[email] = role
-        return current_users
+                member_ids[email] = user.get('id')
+        return current_users, member_ids
 
     def process_albums_to_csv(self, output_file: str = None):
         """Process all albums and create a CSV export."""
-        print("Fetching albums...")
+        log.info("Fetching albums...")
         albums = self.get_albums()
         
         if not albums:
-            print("No albums found.")
+            log.info("No albums found.")
             return
 
         if output_file is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             output_file = f"albums_{timestamp}.csv"
 
-        processed_albums = []
         total_albums = len(albums)
-        
-        print(f"Processing {total_albums} albums...")
-        for index, album in enumerate(albums, 1):
-            if index % 10 == 0:  # Progress indicator every 10 albums
-                print(f"Processing album {index}/{total_albums}")
+        total_entries = 0
+        max_users = 0
+
+        # Stream unpadded rows to a scratch file while tracking the widest row,
+        # then copy them into the output once the header width is known
+        with tempfile.TemporaryFile('w+', newline='', encoding='utf-8') as scratch:
+            scratch_writer = csv.writer(scratch, delimiter=';')
+
+            log.info("Processing %s albums...", total_albums)
+            for index, album in enumerate(albums, 1):
+                if index % 10 == 0:  # Progress indicator every 10 albums
+                    log.info("Processing album %s/%s", index, total_albums)
+                    
+                album_name = album.get('albumName', '')
+                album_id = album.get('id', '')
+                album_users = album.get('albumUsers', [])
                 
-            album_name = album.get('albumName', '')
-            album_id = album.get('id', '')
-            album_users = album.get('albumUsers', [])
-            
-            if not album_users:
-                processed_albums.append({
-                    'name': album_name,
-                    'id': album_id,
-                    'role': '',
-                    'users': []
-                })
-            else:
+                if not album_users:
+                    scratch_writer.writerow([album_name, album_id, ''])
+                    total_entries += 1
+                    continue
+
                 role_users = {}
                 for user_info in album_users:
                     role = user_info.get('role', 'unknown')
@@ -182,54 +314,137 @@ class AlbumAPIProcessor:
                         role_users[role].append(user_email)
                 
                 for role, users in role_users.items():
-                    processed_albums.append({
-                        'name': album_name,
-                        'id': album_id,
-                        'role': role,
-                        'users': users
-                    })
-
-        max_users = max(len(album['users']) for album in processed_albums) if processed_albums else 0
-
-        with open(output_file, 'w', newline='', encoding='utf-8') as f:
-            headers = [self.COL_ALBUM_NAME, self.COL_ALBUM_ID, self.COL_ROLE] + \
-                     [f'User {i+1}' for i in range(max_users)]
-            writer = csv.writer(f, delimiter=';')
-            writer.writerow(headers)
-
-            for album in processed_albums:
-                row = [
-                    album['name'],
-                    album['id'],
-                    album['role']
-                ] + album['users'] + [''] * (max_users - len(album['users']))
-                writer.writerow(row)
-
-        print(f"Created CSV file: {output_file}")
-        print(f"Processed {len(albums)} albums into {len(processed_albums)} entries.")
-        print(f"Maximum number of users in any album: {max_users}")
-
-    def process_share_albums(self, input_file: str):
+                    scratch_writer.writerow([album_name, album_id, role, *users])
+                    total_entries += 1
+                    max_users = max(max_users, len(users))
+
+            scratch.seek(0)
+            with open(output_file, 'w', newline='', encoding='utf-8') as f:
+                headers = [self.COL_ALBUM_NAME, self.COL_ALBUM_ID, self.COL_ROLE] + \
+                         [f'User {i+1}' for i in range(max_users)]
+                writer = csv.writer(f, delimiter=';')
+                writer.writerow(headers)
+
+                # Shared padding, sliced per row, so writerows can consume a generator
+                pad = [''] * len(headers)
+                writer.writerows(row + pad[len(row):] for row in csv.reader(scratch, delimiter=';'))
+
+        log.info("Created CSV file: %s", output_file)
+        log.info("Processed %s albums into %s entries.", total_albums, total_entries)
+        log.info("Maximum number of users in any album: %s", max_users)
+
+    def _process_one_album(self, album_id: str, desired_users: Dict[str, str]) -> Dict:
+        """Synchronize sharing permissions for a single album and return its counters."""
+        stats = {
+            'successful_shares': 0,
+            'failed_shares': 0,
+            'users_removed': 0,
+            'removal_failures': 0,
+            'users_not_found': set()
+        }
+
+        # Get album details for name
+        album_details = self.get_album_details(album_id)
+        album_name = album_details.get('albumName', 'Unknown Album') if album_details else 'Unknown Album'
+
+        # Get current users and their IDs from the same details response, so existing
+        # members never depend on the (possibly cached) email to ID mapping
+        current_users, member_ids = self._parse_album_users(album_details)
+        log.info("\nProcessing album: %s (%s), current users: %s", album_name, album_id, len(current_users))
+
+        # Compute the delta between desired and current state up-front
+        users_to_remove = current_users.keys() - desired_users.keys()
+        users_to_share = {email: role for email, role in desired_users.items()
+                          if current_users.get(email) != role}
+        if not users_to_remove and not users_to_share:
+            log.info("Album %s is already in sync", album_id)
+            return stats
+
+        # Resolve every email this album touches to a user ID in one pass: members from
+        # the album details, new users from the email to ID mapping
+        resolved = {email: member_ids[email] if email in member_ids else self.user_email_to_id.get(email)
+                    for email in users_to_remove | users_to_share.keys()}
+        unknown = {email for email in users_to_share if resolved[email] is None}
+        stats['users_not_found'] = unknown
+        stats['failed_shares'] += len(unknown)
+
+        # Remove unauthorized users concurrently
+        removals = [(email, resolved[email]) for email in users_to_remove if resolved[email]]
+        for email in users_to_remove - {email for email, _ in removals}:
+            stats['removal_failures'] += 1
+            log.warning("Cannot remove %s from album %s: user ID unknown", email, album_id)
+        if log.isEnabledFor(logging.DEBUG):
+            for email, _ in removals:
+                log.debug("Removing user %s from album %s", email, album_id)
+        results = self._map_requests(self.remove_user_from_album, repeat(album_id),
+                                     [user_id for _, user_id in removals])
+        for (email, _), removed in zip(removals, results):
+            if removed:
+                stats['users_removed'] += 1
+                log.debug("Successfully removed %s from album %s", email, album_id)
+            else:
+                stats['removal_failures'] += 1
+                log.warning("Failed to remove %s from album %s", email, album_id)
+
+        # Existing members only need a role change; the add endpoint rejects the whole
+        # batch if any user in it is already a member, so keep the two apart
+        pending = [(email, resolved[email], role)
+                   for email, role in users_to_share.items() if email not in unknown]
+        new_users = [entry for entry in pending if entry[0] not in current_users]
+        role_changes = [entry for entry in pending if entry[0] in current_users]
+
+        if log.isEnabledFor(logging.DEBUG):
+            for email, _, role in role_changes:
+                log.debug("Updating user %s to role %s in album %s", email, role, album_id)
+        results = self._map_requests(self.update_album_user_role, repeat(album_id),
+                                     [user_id for _, user_id, _ in role_changes],
+                                     [role for _, _, role in role_changes])
+        for (email, _, _), updated in zip(role_changes, results):
+            if updated:
+                stats['successful_shares'] += 1
+            else:
+                stats['failed_shares'] += 1
+                log.warning("Failed to update role of %s in album %s", email, album_id)
+
+        if log.isEnabledFor(logging.DEBUG):
+            for email, _, role in new_users:
+                log.debug("Adding user %s with role %s to album %s", email, role, album_id)
+
+        if new_users:
+            if self.share_album_with_users(album_id, [(user_id, role) for _, user_id, role in new_users]):
+                stats['successful_shares'] += len(new_users)
+            elif len(new_users) == 1:
+                stats['failed_shares'] += 1
+            else:
+                # Batch rejected: retry individually so one bad entry doesn't fail the rest
+                log.warning("Batch share failed for album %s, retrying users individually", album_id)
+                for email, user_id, role in new_users:
+                    if self.share_album_with_user(album_id, user_id, role):
+                        stats['successful_shares'] += 1
+                    else:
+                        stats['failed_shares'] += 1
+                        log.warning("Failed to share album %s with %s", album_id, email)
+
+        return stats
+
+    def process_share_albums(self, input_file: str, refresh_users: bool = False):
         """Process CSV file and synchronize album sharing permissions."""
         try:
-            print("Fetching user email to ID mapping...")
-            self.user_email_to_id = self.get_users()
-
             with open(input_file, 'r', newline='', encoding='utf-8') as f:
                 reader = csv.reader(f, delimiter=';')
                 headers = next(reader)
                 
-                # print("Debug: CSV Headers found:", headers)
+                log.debug("CSV headers found: %s", headers)
                 
                 try:
                     name_idx = headers.index(self.COL_ALBUM_NAME)
                     id_idx = headers.index(self.COL_ALBUM_ID)
                     role_idx = headers.index(self.COL_ROLE)
-                    user_indices = range(3, len(headers))
+                    user_columns = slice(3, len(headers))
                 except ValueError as e:
-                    print(f"Error: Invalid CSV format. Required columns not found.")
-                    print(f"Expected columns: {self.COL_ALBUM_NAME}, {self.COL_ALBUM_ID}, {self.COL_ROLE}")
-                    print(f"Found columns: {', '.join(headers)}")
+                    log.error("Error: Invalid CSV format. Required columns not found.")
+                    log.error("Expected columns: %s, %s, %s", self.COL_ALBUM_NAME, self.COL_ALBUM_ID, self.COL_ROLE)
+                    log.error("Found columns: %s", ', '.join(headers))
                     return
 
                 stats = {
@@ -241,7 +456,7 @@ class AlbumAPIProcessor:
                     'users_not_found': set()
                 }
 
-                # Group rows by album ID to process each album once
+                # Group rows by album ID to process each album once: album ID -> {email: role}
                 album_data = {}
                 for row in reader:
                     if not row:
@@ -253,80 +468,50 @@ class AlbumAPIProcessor:
                     if not album_id or not role:
                         continue
 
-                    if album_id not in album_data:
-                        album_data[album_id] = {'users': set(), 'role': role}
+                    desired_users = album_data.setdefault(album_id, {})
 
                     # Add all users from this row
-                    for i in user_indices:
-                        if i < len(row):
-                            email = row[i].strip().lower()
-                            if email:
-                                album_data[album_id]['users'].add((email, role))
-
-                # Process each album
-                for album_id, data in album_data.items():
-                    stats['total_albums'] += 1
-                    
-                    # Get album details for name
-                    album_details = self.get_album_details(album_id)
-                    album_name = album_details.get('albumName', 'Unknown Album') if album_details else 'Unknown Album'
-                    print(f"\nProcessing album: {album_name} ({album_id})")
-                    
-                    # Get current users
-                    current_users = self.get_current_album_users(album_id)
-                    print(f"Current users in album: {len(current_users)}")
-
-                    # Determine users to remove
-                    desired_users = {email for email, _ in data['users']}
-                    users_to_remove = set(current_users.keys()) - desired_users
-
-                    # Remove unauthorized users
-                    for email in users_to_remove:
-                        user_id = self.user_email_to_id.get(email)
-                        if user_id:
-                            print(f"Removing user {email} from album {album_id}")
-                            if self.remove_user_from_album(album_id, user_id):
-                                stats['users_removed'] += 1
-                                print(f"Successfully removed {email}")
-                            else:
-                                stats['removal_failures'] += 1
-                                print(f"Failed to remove {email}")
-
-                    # Add or update authorized users
-                    for email, role in data['users']:
-                        user_id = self.user_email_to_id.get(email)
-                        if user_id:
-                            current_role = current_users.get(email)
-                            if current_role != role:
-                                print(f"Updating/Adding user {email} with role {role}")
-                                if self.share_album_with_user(album_id, user_id, role):
-                                    stats['successful_shares'] += 1
-                                else:
-                                    stats['failed_shares'] += 1
-                        else:
-                            stats['users_not_found'].add(email)
-                            stats['failed_shares'] += 1
+                    for cell in row[user_columns]:
+                        email = cell.strip().lower()
+                        if email:
+                            desired_users[email] = role
+
+                # Load the email to ID mapping, bypassing the cache if it lacks any CSV user
+                desired_emails = set().union(*album_data.values())
+                self.user_email_to_id = self._load_users(desired_emails, refresh=refresh_users)
+
+                # Process albums concurrently; each worker returns its own counters
+                # Album workers fan out per-user requests to a separate pool to avoid
+                # blocking on tasks queued behind themselves
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor, \
+                        ThreadPoolExecutor(max_workers=self.max_workers) as request_executor:
+                    self._request_executor = request_executor
+                    try:
+                        for album_stats in executor.map(self._process_one_album, album_data.keys(), album_data.values()):
+                            stats['total_albums'] += 1
+                            stats['users_not_found'] |= album_stats.pop('users_not_found')
+                            for key, value in album_stats.items():
+                                stats[key] += value
+                    finally:
+                        self._request_executor = None
 
                 # Print final statistics
-                print("\nOperation completed:")
-                print(f"Total albums processed: {stats['total_albums']}")
-                print(f"Successful shares/updates: {stats['successful_shares']}")
-                print(f"Failed shares/updates: {stats['failed_shares']}")
-                print(f"Users removed: {stats['users_removed']}")
-                print(f"Failed removals: {stats['removal_failures']}")
+                log.info("\nOperation completed:")
+                log.info("Total albums processed: %s", stats['total_albums'])
+                log.info("Successful shares/updates: %s", stats['successful_shares'])
+                log.info("Failed shares/updates: %s", stats['failed_shares'])
+                log.info("Users removed: %s", stats['users_removed'])
+                log.info("Failed removals: %s", stats['removal_failures'])
                 if stats['users_not_found']:
-                    print("\nUsers not found:")
+                    log.info("\nUsers not found:")
                     for email in sorted(stats['users_not_found']):
-                        print(f"- {email}")
+                        log.info("- %s", email)
 
         except FileNotFoundError:
-            print(f"Error: Input file '{input_file}' not found.")
+            log.error("Error: Input file '%s' not found.", input_file)
             sys.exit(1)
         except Exception as e:
-            print(f"Error processing file: {e}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Error processing file (%s): %s", type(e).__name__, e)
             sys.exit(1)
 
 def main():
@@ -339,22 +524,39 @@ def main():
     parser.add_argument('--api-key', help='API key for authentication')
     parser.add_argument('--output', help='Output CSV file name (for list-all)')
     parser.add_argument('--input', help='Input CSV file name (for share-albums)')
+    parser.add_argument('--check-server', action='store_true',
+                      help='Check that the server is reachable before running the command')
+    parser.add_argument('--refresh-users', action='store_true',
+                      help='Ignore the cached user list and refetch it (for share-albums)')
+    parser.add_argument('--verbose', action='store_true',
+                      help='Log every individual user change, not just per-album summaries')
+    parser.add_argument('--workers', type=int, default=8,
+                      help='Number of albums processed concurrently (for share-albums, default: 8)')
     
     args = parser.parse_args()
 
+    # Level is set on our logger only, so --verbose doesn't enable urllib3's debug output
+    logging.basicConfig(format='%(message)s')
+    log.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
     if not args.command or not args.url or not args.api_key:
         parser.print_help()
         sys.exit(1)
 
-    processor = AlbumAPIProcessor(args.url, args.api_key)
+    if args.workers < 1:
+        log.error("Error: --workers must be at least 1")
+        sys.exit(1)
+
+    processor = AlbumAPIProcessor(args.url, args.api_key, max_workers=args.workers,
+                                  verify_reachability=args.check_server)
 
     if args.command == 'list-all':
         processor.process_albums_to_csv(args.output)
     elif args.command == 'share-albums':
         if not args.input:
-            print("Error: --input file is required for share-albums command")
+            log.error("Error: --input file is required for share-albums command")
             sys.exit(1)
-        processor.process_share_albums(args.input)
+        processor.process_share_albums(args.input, refresh_users=args.refresh_users)
     else:
         parser.print_help()
         sys.exit(1)